@@ -0,0 +1,11 @@
+from .chunk_index import ChunkIndex, channel_range, checksum
+from .delta_codec import DeltaDecoder, DeltaEncoder, is_delta_encoded
+
+__all__ = [
+    "ChunkIndex",
+    "DeltaDecoder",
+    "DeltaEncoder",
+    "channel_range",
+    "checksum",
+    "is_delta_encoded",
+]
@@ -0,0 +1,71 @@
+import zlib
+
+import h5py
+import numpy as np
+import numpy.typing as npt
+
+
+def checksum(stored: npt.NDArray, crc: int = 0) -> int:
+    return zlib.crc32(np.ascontiguousarray(stored).tobytes(), crc)
+
+
+def channel_range(values: npt.NDArray) -> tuple[npt.NDArray, npt.NDArray]:
+    # Per-channel min and max of frames shaped (frames, channels, ...)
+    values = values.reshape(*values.shape[:2], -1)
+    return values.min(axis=(0, 2)), values.max(axis=(0, 2))
+
+
+class ChunkIndex:
+    """
+    Per-chunk CRC32 of the stored frames, per-channel min/max of their values and the
+    number of frames written, kept next to the state dataset so that a file can be
+    validated without decompressing it.
+    """
+
+    def __init__(self, group: h5py.Group) -> None:
+        self.group = group
+        self.chunk_frames = int(group.attrs["chunk_frames"])
+        self.reset()
+
+    @classmethod
+    def create(cls, file: h5py.File, steps: int, chunk_frames: int, channels: int) -> "ChunkIndex":
+        chunks = -(-steps // chunk_frames)
+        group = file.create_group("index")
+        group.create_dataset("checksum", (chunks,), dtype=np.uint32)
+        group.create_dataset("min", (chunks, channels), dtype=np.float32)
+        group.create_dataset("max", (chunks, channels), dtype=np.float32)
+        group.create_dataset("written", (chunks,), dtype=np.int32)
+        group.attrs["chunk_frames"] = chunk_frames
+        return cls(group)
+
+    def reset(self) -> None:
+        self.crc = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def resume(self, idx: int, stored: npt.NDArray, values: npt.NDArray) -> None:
+        """
+        Continue at frame idx from the frames already written to its chunk
+        """
+        self.reset()
+        if len(stored) > 0:
+            self.crc = checksum(stored)
+            self.min, self.max = channel_range(values)
+
+    def update(self, idx: int, stored: npt.NDArray, values: npt.NDArray) -> None:
+        """
+        Add frame idx as stored in the file and its decoded values
+        """
+        chunk, offset = divmod(idx, self.chunk_frames)
+        if offset == 0:
+            self.reset()
+
+        low, high = channel_range(values[None])
+        self.crc = checksum(stored, self.crc)
+        self.min = np.minimum(self.min, low)
+        self.max = np.maximum(self.max, high)
+
+        self.group["checksum"][chunk] = self.crc
+        self.group["min"][chunk] = self.min
+        self.group["max"][chunk] = self.max
+        self.group["written"][chunk] = offset + 1
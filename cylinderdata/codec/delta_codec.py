@@ -0,0 +1,81 @@
+from typing import Any, Optional, Tuple
+
+import h5py
+import numpy as np
+import numpy.typing as npt
+
+
+class DeltaEncoder:
+    """
+    Quantizes frames to integer multiples of quantization and stores the absolute value
+    every keyframe_interval frames and the difference to the previous frame in between.
+    Deltas are taken between quantized frames, so the error stays below quantization / 2.
+    """
+
+    def __init__(self, keyframe_interval: int, quantization: float) -> None:
+        self.keyframe_interval = keyframe_interval
+        self.quantization = quantization
+        self.previous: Optional[npt.NDArray[np.int32]] = None
+
+    def __call__(self, idx: int, frame: npt.NDArray) -> npt.NDArray[np.int32]:
+        quantized = np.rint(frame / self.quantization).astype(np.int32)
+        if idx % self.keyframe_interval == 0 or self.previous is None:
+            encoded = quantized
+        else:
+            encoded = quantized - self.previous
+        self.previous = quantized
+        return encoded
+
+    def resume(self, dataset: h5py.Dataset, idx: int) -> None:
+        """
+        Continue encoding at frame idx of an existing dataset
+        """
+        if idx % self.keyframe_interval != 0:
+            self.previous = DeltaDecoder(dataset).quantized(idx - 1, idx)[-1]
+
+
+class DeltaDecoder:
+    """
+    Decodes a window of frames with a cumulative sum from its keyframe, or from the last
+    decoded frame when windows are read in order.
+    """
+
+    def __init__(self, dataset: h5py.Dataset) -> None:
+        self.dataset = dataset
+        self.keyframe_interval = int(dataset.attrs["keyframe_interval"])
+        self.quantization = float(dataset.attrs["quantization"])
+        self.last: Optional[Tuple[int, npt.NDArray[np.int64]]] = None
+
+    def quantized(self, start: int, stop: int) -> npt.NDArray[np.int64]:
+        K = self.keyframe_interval
+        first = start // K * K
+
+        # Continue from the last decoded frame if it is in the same segment
+        base = None
+        if self.last is not None and first <= self.last[0] < start:
+            first, base = self.last[0] + 1, self.last[1]
+
+        raw = self.dataset[first:stop].astype(np.int64)
+        if base is not None and first % K != 0:
+            raw[0] += base
+        total = np.cumsum(raw, axis=0)
+
+        # Restart the sum at every keyframe inside the window
+        segment = np.arange(first, stop) // K * K - first - 1
+        restart = segment >= 0
+        if np.any(restart):
+            offset = np.where(
+                restart.reshape(-1, *[1] * (raw.ndim - 1)), total[np.maximum(segment, 0)], 0
+            )
+            total = total - offset
+
+        self.last = (stop - 1, total[-1])
+        skip = start - first
+        return total[skip:]
+
+    def __call__(self, start: int, stop: int) -> npt.NDArray[np.float32]:
+        return (self.quantized(start, stop) * self.quantization).astype(np.float32)
+
+
+def is_delta_encoded(dataset: Any) -> bool:
+    return "keyframe_interval" in dataset.attrs
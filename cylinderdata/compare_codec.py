@@ -0,0 +1,95 @@
+import argparse
+import os
+import pathlib
+import tempfile
+import time
+
+import h5py
+import numpy as np
+import rootutils
+
+rootutils.setup_root(__file__, indicator="pyproject.toml", pythonpath=True)
+from cylinderdata.codec import DeltaDecoder, DeltaEncoder
+
+
+def write_gzip(path: str, frames: np.ndarray) -> h5py.File:
+    file = h5py.File(path, "w")
+    file.create_dataset("state", data=frames, chunks=(10, *frames.shape[1:]), compression="gzip")
+    return file
+
+
+def write_delta(
+    path: str, frames: np.ndarray, keyframe_interval: int, quantization: float
+) -> h5py.File:
+    file = h5py.File(path, "w")
+    dataset = file.create_dataset(
+        "state",
+        frames.shape,
+        chunks=(keyframe_interval, *frames.shape[1:]),
+        compression="gzip",
+        shuffle=True,
+        dtype=np.int32,
+    )
+    dataset.attrs["keyframe_interval"] = keyframe_interval
+    dataset.attrs["quantization"] = quantization
+    encoder = DeltaEncoder(keyframe_interval, quantization)
+    for idx, frame in enumerate(frames):
+        dataset[idx] = encoder(idx, frame)
+    return file
+
+
+def time_windows(read, starts: np.ndarray, sequence_length: int) -> float:
+    start_time = time.perf_counter()
+    for start in starts:
+        read(start, start + sequence_length)
+    return len(starts) * sequence_length / (time.perf_counter() - start_time)
+
+
+def compare_codec(
+    path: pathlib.Path,
+    frames: int,
+    keyframe_interval: int,
+    quantization: float,
+    sequence_length: int,
+) -> None:
+    with h5py.File(path, "r") as simulation:
+        states = np.array(simulation["state"][:frames], dtype=np.float32)
+
+    rng = np.random.default_rng(0)
+    starts = rng.integers(0, len(states) - sequence_length, size=50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        gzip_file = write_gzip(os.path.join(tmp, "gzip.h5"), states)
+        delta_file = write_delta(
+            os.path.join(tmp, "delta.h5"), states, keyframe_interval, quantization
+        )
+        decoder = DeltaDecoder(delta_file["state"])
+
+        print(f"{'codec':<8}{'ratio':>10}{'frames/s':>12}{'max error':>12}")
+        for name, file, read in [
+            ("gzip", gzip_file, lambda a, b: gzip_file["state"][a:b]),
+            ("delta", delta_file, decoder),
+        ]:
+            ratio = states.nbytes / file["state"].id.get_storage_size()
+            throughput = time_windows(read, starts, sequence_length)
+            error = np.abs(read(0, len(states)) - states).max()
+            print(f"{name:<8}{ratio:>10.2f}{throughput:>12.1f}{error:>12.2e}")
+            file.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename", help="Path to the dataset")
+    parser.add_argument("--frames", type=int, default=200, help="Number of frames to compare")
+    parser.add_argument("--keyframe-interval", type=int, default=10)
+    parser.add_argument("--quantization", type=float, default=1e-4)
+    parser.add_argument("--sequence-length", type=int, default=10)
+    args = parser.parse_args()
+
+    compare_codec(
+        pathlib.Path(args.filename),
+        args.frames,
+        args.keyframe_interval,
+        args.quantization,
+        args.sequence_length,
+    )
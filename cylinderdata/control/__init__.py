@@ -2,5 +2,15 @@ from .controller import Controller
 from .zero import ZeroController
 from .baseline import BaselineController
 from .pd import PDController
+from .scheduled import ScheduledController, compile_schedule, load_schedule, save_schedule
 
-__all__ = ["Controller", "ZeroController", "BaselineController", "PDController"]
+__all__ = [
+    "Controller",
+    "ZeroController",
+    "BaselineController",
+    "PDController",
+    "ScheduledController",
+    "compile_schedule",
+    "load_schedule",
+    "save_schedule",
+]
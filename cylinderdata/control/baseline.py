@@ -4,6 +4,8 @@ from .controller import Controller
 
 
 class BaselineController(Controller):
+    open_loop = True
+
     def __init__(
         self,
         max_control: float,
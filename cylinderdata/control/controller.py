@@ -3,6 +3,9 @@ from typing import Any
 
 
 class Controller(ABC):
+    # Controllers that ignore observations can be compiled into a schedule
+    open_loop = False
+
     def __init__(self, max_control: float, start_time: float, control_duration: float) -> None:
         self.max_control = max_control
         self.start_time = start_time
@@ -1,3 +1,84 @@
+class DynamicsService:
+    # Loads the dynamics model once and evaluates it on in-memory arrays. Opt-in with
+    # dynamics_service = 1, see the README for the interface find_dynamics.py must expose
+    def __init__(self, training_path, ckpt_name):
+        spec = importlib.util.spec_from_file_location(
+            "find_dynamics", training_path + "/find_dynamics.py"
+        )
+        self.module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.module)
+        self.model = self.module.load_model(training_path, ckpt_name)
+
+    def __call__(self, X, u):
+        A, x0 = self.module.find_dynamics(self.model, X, u)
+        return np.asarray(A), np.asarray(x0)
+
+
+class SnapshotWriter:
+    # Appends snapshots, controls and costs to resizable datasets of one h5 file in
+    # the state/control layout read by CylinderDataset. Rows are buffered in memory
+    # and written once flush_count rows are pending or flush_time seconds have passed.
+    def __init__(self, filename, shape, with_cost, flush_count=10, flush_time=60.0):
+        self.file = h5py.File(filename, "a")
+        self.flush_count = flush_count
+        self.flush_time = flush_time
+        self.last_flush = time.perf_counter()
+
+        # Continue an existing file
+        self.dataset_state = self._require("state", shape, np.float32, chunks=(10, *shape))
+        self.dataset_control = self._require("control", (1,), np.float32)
+        self.dataset_cost = self._require("cost", (), np.float64) if with_cost else None
+        self.steps = self.dataset_state.shape[0]
+        self.file.attrs["steps"] = self.steps
+        self.file.attrs["complete"] = False
+
+        self.state, self.control, self.cost = [], [], []
+
+    def _require(self, name, shape, dtype, chunks=None):
+        if name in self.file:
+            return self.file[name]
+        return self.file.create_dataset(
+            name,
+            (0, *shape),
+            maxshape=(None, *shape),
+            chunks=chunks or (1024, *shape),
+            compression="gzip",
+            dtype=dtype,
+        )
+
+    def append(self, state, control, cost=None):
+        self.state.append(state)
+        self.control.append([control])
+        self.cost.append(cost)
+
+        pending = len(self.state) >= self.flush_count
+        if pending or time.perf_counter() - self.last_flush >= self.flush_time:
+            self.flush()
+
+    def flush(self):
+        n = len(self.state)
+        if n > 0:
+            start, self.steps = self.steps, self.steps + n
+            for dataset, rows in [
+                (self.dataset_state, self.state),
+                (self.dataset_control, self.control),
+                (self.dataset_cost, self.cost),
+            ]:
+                if dataset is not None:
+                    dataset.resize(self.steps, axis=0)
+                    dataset[start:] = np.array(rows)
+
+            self.file.attrs["steps"] = self.steps
+            self.file.flush()
+            self.state, self.control, self.cost = [], [], []
+        self.last_flush = time.perf_counter()
+
+    def close(self):
+        self.flush()
+        self.file.attrs["complete"] = True
+        self.file.close()
+
+
 class ControllerPlugin(BasePlugin):
     name = "controller"
     systems = ["*"]
@@ -21,6 +102,16 @@ class ControllerPlugin(BasePlugin):
 
         # Define directory where solution snapshots should be saved
         self.save_dir = self.cfg.getpath(cfgsect, "save_dir")
+        self.writer = None
+        _, rank, root = get_comm_rank_root()
+        if self.save_data == 1 and rank == root:
+            self.writer = SnapshotWriter(
+                self.save_dir + "/sol_data.h5",
+                (4, 128, 256),
+                with_cost=self.perform_mpc,
+                flush_count=self.cfg.getint(cfgsect, "flush_count", 10),
+                flush_time=self.cfg.getfloat(cfgsect, "flush_time", 60.0),
+            )
 
         # If performing mpc, then load network
         if self.perform_mpc:
@@ -48,9 +139,9 @@ class ControllerPlugin(BasePlugin):
             for k, v in args_dict.items():
                 vars(self.args)[k] = v
 
-            # Define array to hold old time snapshots and control inputs of the system
-            self.X = np.zeros((self.args.seq_length // 2 + 1, 128, 256, 4), dtype=np.float32)
-            self.u = np.zeros((self.args.seq_length // 2, self.args.action_dim), dtype=np.float32)
+            # Define ring buffers to hold old time snapshots and control inputs of the system
+            self.X = RingBuffer(self.args.seq_length // 2 + 1, (128, 256, 4))
+            self.u = RingBuffer(self.args.seq_length // 2, (self.args.action_dim,))
 
             # Initialize predicted state
             self.x_pred = np.zeros(self.args.code_dim)
@@ -73,6 +164,24 @@ class ControllerPlugin(BasePlugin):
             self.B = np.array(f["B"])
             self.goal_state = np.array(f["goal_state"])
 
+            # Keep the dynamics model loaded instead of launching a script every step,
+            # only the root rank evaluates it
+            self.dynamics = None
+            if self.cfg.getint(cfgsect, "dynamics_service", 0) and rank == root:
+                try:
+                    self.dynamics = DynamicsService(self.training_path, self.ckpt_name)
+                except Exception as e:
+                    print(f"Could not load dynamics service ({e}) -- using find_dynamics.py")
+
+            # Build MPC problem once, later steps only refresh its parameters
+            self.mpc_deadline = self.cfg.getfloat(cfgsect, "mpc_deadline", float("inf"))
+            self.mpc_solve_times = []
+            self._build_mpc_problem()
+
+            # Compare latency of the in-process model and the script once the history
+            # holds real snapshots
+            self.benchmark = self.dynamics is not None and self.cfg.getint(cfgsect, "benchmark", 0)
+
         # Initial omega
         intg.system.omega = 0
 
@@ -86,14 +195,13 @@ class ControllerPlugin(BasePlugin):
         # Physical location of the solution points
         plocs = [p.swapaxes(1, 2) for p in intg.system.ele_ploc_upts]
 
-        # Load map from point to index
+        # Load map from point to grid index as an (npts, 2) index array
         with open("loc_to_idx.json") as loc_to_idx:
-            loc_to_idx_str = json.load(
+            loc_to_idx = json.load(
                 loc_to_idx,
             )
-            self.loc_to_idx = dict()
-            for key in loc_to_idx_str:
-                self.loc_to_idx[int(key)] = loc_to_idx_str[key]
+            grid_idx = np.array([loc_to_idx[str(i)] for i in range(len(loc_to_idx))], dtype=int)
+            self._grid_rows, self._grid_cols = grid_idx.T
 
         # Locate the closest solution points in our partition
         closest = _closest_upts(intg.system.ele_types, plocs, self.pts)
@@ -107,22 +215,46 @@ class ControllerPlugin(BasePlugin):
             ptsrank.append(mrank)
             ptsinfo[mrank].append(comm.bcast(cp[1:] if rank == mrank else None, root=mrank))
 
-    def _process_samples(self, samps):
-        samps = np.array(samps)
+        # Index arrays of our points per element type: (position in samples, ui, ei)
+        self._nvars = intg.soln[0].shape[1]
+        self._sampidx = {}
+        for pos, (_, etype, (ui, ei)) in enumerate(ptsinfo[rank]):
+            self._sampidx.setdefault(etype, []).append((pos, ui, ei))
+        self._sampidx = {et: np.array(idx, dtype=int).T for et, idx in self._sampidx.items()}
+
+        # Gatherv counts and displacements, in values, of each rank's samples
+        npts = np.array([len(pi) for pi in ptsinfo])
+        self._gcounts = npts * self._nvars
+        self._gdispls = np.concatenate(([0], np.cumsum(self._gcounts)[:-1]))
+
+        # Row of the gathered buffer holding each point, in the order of the point list
+        offsets = np.concatenate(([0], np.cumsum(npts)[:-1]))
+        order = np.empty(len(ptsrank), dtype=int)
+        for i, mrank in enumerate(ptsrank):
+            order[i] = offsets[mrank]
+            offsets[mrank] += 1
+        self._gorder = order[: len(self._grid_rows)]
 
+    def _process_samples(self, samps):
         # If necessary then convert to primitive form
         if self.fmt == "primitive" and samps.size:
             samps = self.elementscls.con_to_pri(samps.T, self.cfg)
             samps = np.array(samps).T
 
-        return samps.tolist()
+        return np.ascontiguousarray(samps, dtype=np.float64)
 
     # Find A-matrix and initial code value from neural network
     def _find_dynamics(self):
+        if self.dynamics is not None:
+            return self.dynamics(self.X.view(), self.u.view())
+        return self._find_dynamics_subprocess()
+
+    # Find A-matrix and initial code value by running find_dynamics.py
+    def _find_dynamics_subprocess(self):
         # Save X and u to file
         f = h5py.File("./X_u.h5", "w")
-        f["X"] = self.X
-        f["u"] = self.u
+        f["X"] = self.X.view()
+        f["u"] = self.u.view()
         f.close()
 
         # Run python script to find A matrix and initial state
@@ -143,40 +275,78 @@ class ControllerPlugin(BasePlugin):
 
         return A, x0
 
-    # Perform MPC optimization to find next input
+    # Time both ways of evaluating the dynamics model on the current history
+    def _benchmark_dynamics(self, repeats=10):
+        for name, find in [
+            ("subprocess", self._find_dynamics_subprocess),
+            ("in-process", lambda: self.dynamics(self.X.view(), self.u.view())),
+        ]:
+            start = time.perf_counter()
+            for _ in range(repeats):
+                find()
+            elapsed = (time.perf_counter() - start) / repeats
+            print(f"find_dynamics {name}: {1000 * elapsed:.2f} ms per call")
+
+    # Build the MPC problem once with the model, initial code and goal as parameters
     # Following example from CVXPY documentation
-    def _find_mpc_input(self, A, B, x0):
-        # First define prediction horizon
-        T = 16
+    def _build_mpc_problem(self, T=16):
+        n, m = self.args.code_dim, self.args.action_dim
+
+        # Define parameters refreshed every control step
+        self.mpc_A = Parameter((n, n))
+        self.mpc_B = Parameter((n, m))
+        self.mpc_x0 = Parameter(n)
+        self.mpc_goal = Parameter(n)
 
         # Define variables
-        x = Variable(shape=(self.args.code_dim, T + 1))
-        u = Variable(shape=(self.args.action_dim, T))
+        x = Variable(shape=(n, T + 1))
+        self.mpc_u = Variable(shape=(m, T))
+        u = self.mpc_u
 
         # Define costs for states and inputs
-        Q = np.eye(self.args.code_dim)
-        R = self.R * np.eye(self.args.action_dim)
+        Q = np.eye(n)
+        R = self.R * np.eye(m)
 
-        # Construct and solve optimization problem
+        # Construct optimization problem
         cost = 0
         constr = []
         for t in range(T):
-            cost += quad_form((x[:, t + 1] - self.goal_state), Q) + quad_form(u[:, t], R)
+            cost += quad_form((x[:, t + 1] - self.mpc_goal), Q) + quad_form(u[:, t], R)
             constr += [
-                x[:, t + 1] == A * x[:, t] + (B * u[:, t])[:, 0],
+                x[:, t + 1] == self.mpc_A @ x[:, t] + self.mpc_B @ u[:, t],
                 norm(u[:, t], "inf") <= self.u_max,
             ]
 
         # Sum problem objectives and concatenate constraints
-        constr += [x[:, 0] == x0]
-        prob = Problem(Minimize(cost), constr)
-        prob.solve()
+        constr += [x[:, 0] == self.mpc_x0]
+        self.mpc_problem = Problem(Minimize(cost), constr)
 
-        x1 = np.array([x.value[i, 1] for i in range(x.value.shape[0])])
+        # Constant across steps
+        self.mpc_B.value = self.B.reshape(n, m)
+        self.mpc_goal.value = self.goal_state.reshape(n)
+
+    # Perform MPC optimization to find next input
+    def _find_mpc_input(self, A, x0):
+        # Previous input is applied if the solve fails or misses its deadline
+        u_prev = float(self.u[-1, 0])
+
+        self.mpc_A.value = A
+        self.mpc_x0.value = x0.reshape(-1)
+
+        start = time.perf_counter()
         try:
-            return u.value[0, 0]  # Change if not scalar input
-        except:
-            return 0.0
+            self.mpc_problem.solve(warm_start=True)
+            status = self.mpc_problem.status
+        except SolverError:
+            status = "solver_error"
+        elapsed = time.perf_counter() - start
+        self.mpc_solve_times.append(elapsed)
+        print(f"MPC solve time: {1000 * elapsed:.2f} ms ({status})")
+
+        solved = status in (OPTIMAL, OPTIMAL_INACCURATE)
+        if elapsed > self.mpc_deadline or not solved:
+            return u_prev
+        return float(self.mpc_u.value[0, 0])  # Change if not scalar input
 
     def __call__(self, intg):
         # Return if there is nothing to do for this step
@@ -193,40 +363,21 @@ class ControllerPlugin(BasePlugin):
         ourpts = self._ptsinfo[comm.rank]
 
         # Sample the solution matrices at these points
-        samples = [solns[et][ui, :, ei] for _, et, (ui, ei) in ourpts]
+        samples = np.empty((len(ourpts), self._nvars))
+        for et, (pos, ui, ei) in self._sampidx.items():
+            samples[pos] = solns[et][ui, :, ei]
         samples = self._process_samples(samples)
 
-        # Gather to the root rank to give a list of points per rank
-        samples = comm.gather(samples, root=root)
+        # Gather to the root rank into one contiguous buffer ordered by rank
+        if rank == root:
+            gathered = np.empty((len(self._ptsrank), self._nvars))
+            recvbuf = [gathered, self._gcounts, self._gdispls, get_mpi("double")]
+        else:
+            recvbuf = None
+        comm.Gatherv(samples, recvbuf, root=root)
 
         # If we're the root rank process the data
         if rank == root:
-            data = []
-
-            # Collate
-            iters = [zip(pi, sp) for pi, sp in zip(self._ptsinfo, samples)]
-
-            for mrank in self._ptsrank:
-                # Unpack
-                (ploc, etype, idx), samp = next(iters[mrank])
-
-                # Determine the physical mesh rank
-                prank = intg.rallocs.mprankmap[mrank]
-
-                # Prepare the output row [[x, y], [rho, rhou, rhouv, E]]
-                row = [ploc, samp]
-
-                # Append
-                data.append(row)
-
-            # Define info for saving to file
-            list_of_files = glob.glob(self.save_dir + "/*")
-            if len(list_of_files) == 0:
-                file_num = 0
-            else:
-                latest_file = max(list_of_files, key=os.path.getctime)
-                file_num = int(latest_file[-7:-3])
-
             # Save data in desired format
             # Define freestream values for to be used for cylinder
             rho = 1.0
@@ -237,18 +388,17 @@ class ControllerPlugin(BasePlugin):
             freestream = np.array([rho, rho * u, rho * v, e])
             sol_data = np.zeros((128, 256, 4))
             sol_data[:, :] = freestream
-            for i in range(len(self.loc_to_idx)):
-                idx1, idx2 = self.loc_to_idx[i]
-                sol_data[idx1, idx2] = data[i][1]
+            sol_data[self._grid_rows, self._grid_cols] = gathered[self._gorder]
 
             # Update running total of previous states
             if self.perform_mpc:
-                self.X = np.vstack((self.X[1:], np.expand_dims(sol_data, axis=0)))
+                self.X.append(sol_data)
 
             # Initialize values
             t = intg.tcurr
             self.t_old = t
             pred_error = 0.0
+            cost = np.nan
 
             if self.set_omega == 0:
                 omega = 0.0
@@ -256,15 +406,18 @@ class ControllerPlugin(BasePlugin):
                 # Find model of system and determine optimal input with MPC
                 try:
                     A, x0 = self._find_dynamics()
-                    if np.linalg.norm(self.X[0]) > 0.0:
-                        u0 = self.u[-1]
-                        omega = self._find_mpc_input(A, self.B, x0)
+                    cost = np.linalg.norm(self.goal_state - x0)
+                    if self.X.full:
+                        if self.benchmark:
+                            self.benchmark = False
+                            self._benchmark_dynamics()
+                        omega = self._find_mpc_input(A, x0)
                     else:
                         omega = 0.0  # No input if insufficient data to construct dynamical model
                 except:
                     print("Had an error in mpc -- setting omega to 0")
                     omega = 0.0
-                self.u = np.concatenate((self.u[1:], np.expand_dims(np.array([omega]), axis=0)))
+                self.u.append([omega])
             else:
                 # To generate training data
                 # Have no inputs for periods, otherwise sinusoidal
@@ -282,18 +435,15 @@ class ControllerPlugin(BasePlugin):
                 # omega = gain*rho_v/rho
 
             # Save data if desired
-            if self.save_data == 1:
-                # Save to h5 file
-                file_num += 1
-                filename = self.save_dir + "/sol_data_" + str(file_num).zfill(4) + ".h5"
-                f = h5py.File(filename, "w")
-                f["sol_data"] = sol_data
-                f["control_input"] = omega
-                if self.perform_mpc:
-                    f["cost"] = np.linalg.norm(self.goal_state - x0)
-                f.close()
+            if self.writer is not None:
+                # Append channel-first snapshot to the h5 file
+                self.writer.append(sol_data.transpose(2, 0, 1), omega, cost)
         else:
             omega = None
 
         # Broadcast omega to all of the MPI ranks
         intg.system.omega = float(comm.bcast(omega, root=root))
+
+    def __del__(self):
+        if self.writer is not None:
+            self.writer.close()
@@ -0,0 +1,70 @@
+from typing import Any
+
+import h5py
+import numpy as np
+import numpy.typing as npt
+
+from .controller import Controller
+
+
+def compile_schedule(controller: Controller, dt: float, t_end: float) -> npt.NDArray[np.float32]:
+    """
+    Evaluate an open-loop controller once on the solver time grid t = k * dt.
+    The controller is stepped exactly as during integration, so it should be a fresh instance.
+    """
+    if not controller.open_loop:
+        raise ValueError(
+            f"{type(controller).__name__} depends on observations and cannot be precomputed"
+        )
+
+    n_steps = int(round(t_end / dt)) + 1
+    schedule = np.zeros(n_steps, dtype=np.float32)
+    for k in range(n_steps):
+        schedule[k] = controller(k * dt, None)
+    return schedule
+
+
+def save_schedule(file: h5py.File, schedule: npt.NDArray[np.float32], dt: float) -> None:
+    """
+    Store a compiled schedule in an open h5 file
+    """
+    dataset = file.create_dataset("control_schedule", data=schedule, dtype=np.float32)
+    dataset.attrs["dt"] = dt
+
+
+def load_schedule(path: str) -> tuple[npt.NDArray[np.float32], float]:
+    """
+    Load a compiled schedule and its time step from an h5 file
+    """
+    with h5py.File(path, "r") as file:
+        dataset = file["control_schedule"]
+        return np.array(dataset), float(dataset.attrs["dt"])
+
+
+class ScheduledController(Controller):
+    open_loop = True
+
+    def __init__(
+        self,
+        max_control: float,
+        start_time: float,
+        control_duration: float,
+        schedule: npt.NDArray[np.float32],
+        dt: float,
+    ) -> None:
+        super().__init__(max_control, start_time, control_duration)
+        self.schedule = np.asarray(schedule, dtype=np.float32)
+        self.dt = dt
+
+    @classmethod
+    def from_file(
+        cls, path: str, max_control: float, start_time: float, control_duration: float
+    ) -> "ScheduledController":
+        schedule, dt = load_schedule(path)
+        return cls(max_control, start_time, control_duration, schedule, dt)
+
+    def __call__(self, t: float, obs: Any) -> float:
+        # Hold the last value past the end of the schedule
+        idx = min(int(round(t / self.dt)), len(self.schedule) - 1)
+        self.control = float(self.schedule[idx])
+        return self.control
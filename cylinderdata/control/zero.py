@@ -3,6 +3,8 @@ from .controller import Controller
 
 
 class ZeroController(Controller):
+    open_loop = True
+
     def __init__(self, max_control: float, start_time: float, control_duration: float) -> None:
         super().__init__(max_control, start_time, control_duration)
 
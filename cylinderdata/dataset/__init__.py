@@ -1,4 +1,5 @@
-from .cylinder_dataset import CylinderDataset, CylinderField
+from .cylinder_dataset import CylinderDataset, CylinderField, CylinderType
 from .h5_dataset import H5SequenceDataset
+from .ring_buffer import RingBuffer
 
-__all__ = ["CylinderDataset", "CylinderField", "H5SequenceDataset"]
+__all__ = ["CylinderDataset", "CylinderField", "CylinderType", "H5SequenceDataset", "RingBuffer"]
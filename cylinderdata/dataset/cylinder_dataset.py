@@ -1,10 +1,12 @@
 from enum import Enum, IntEnum
 from pathlib import Path
 
+import h5py
 import numpy as np
 import torch
 from torch import Tensor
 
+from cylinderdata.codec import DeltaDecoder, is_delta_encoded
 from cylinderdata.dataset.h5_dataset import H5SequenceDataset
 
 
@@ -20,6 +22,7 @@ class CylinderType(Enum):
     VORTICITY = "vorticity"
     SIM = "sim"
     FULL = "full"
+    POD = "pod"
 
 
 class CylinderDataset(H5SequenceDataset):
@@ -30,27 +33,83 @@ class CylinderDataset(H5SequenceDataset):
         include_control: bool = False,
         type: CylinderType = CylinderType.FULL,
         transform: torch.nn.Module | None = None,
+        resample_dt: float | None = None,
     ):
         super().__init__(path, sequence_length, include_control)
         self.type = type
         self.transform = transform
+        self.decoder = None
+
+        # Frames stored so far, adaptive sampling may store fewer than steps
+        self.frames = int(self.parameters.get("frames", self.parameters["steps"]))
+
+        # Grid points inside the mesh, packed states only store these
+        self.mask = None
+        self.packed = False
+        with h5py.File(path, "r") as simulation:
+            if "mask" in simulation:
+                self.mask = torch.tensor(np.array(simulation["mask"]), dtype=torch.bool)
+                self.packed = bool(simulation["state"].attrs.get("packed", False))
+
+        # Linear interpolation of adaptively sampled frames onto a uniform time grid
+        self.resample = None
+        if resample_dt is not None:
+            with h5py.File(path, "r") as simulation:
+                time = np.array(simulation["time"][: self.frames])
+            uniform = np.arange(time[0], time[-1], resample_dt)
+            lower = np.clip(np.searchsorted(time, uniform, side="right") - 1, 0, self.frames - 2)
+            weight = (uniform - time[lower]) / (time[lower + 1] - time[lower])
+            self.resample = (lower, weight.astype(np.float32))
 
     def __len__(self) -> int:
-        return int(self.parameters["steps"])
+        if self.resample is not None:
+            return len(self.resample[0])
+        return self.frames
 
     def get_dataset_control(self, idx: int) -> Tensor:
+        # Control is held between stored frames
+        if self.resample is not None:
+            idx = int(self.resample[0][idx])
         return torch.tensor(np.array(self.dataset["control"][idx]), dtype=torch.float32)
 
     def get_dataset_state(self, idx: int) -> Tensor:
-        state = torch.tensor(np.array(self.dataset["state"][idx]), dtype=torch.float32)
+        if self.resample is not None:
+            lower, weight = int(self.resample[0][idx]), self.resample[1][idx]
+            states = self.read_states(lower, lower + 2)
+            state = torch.tensor((1 - weight) * states[0] + weight * states[1])
+        else:
+            state = torch.tensor(self.read_states(idx, idx + 1)[0], dtype=torch.float32)
 
         if self.type == CylinderType.VORTICITY:
             state = state[CylinderField.VORT]
         elif self.type == CylinderType.SIM:
             state = state[:3]
 
+        return state
+
+    def transform_state(self, state: Tensor) -> Tensor:
         # Apply transform
         if self.transform:
             state = self.transform(state)
-
         return state
+
+    def read_states(self, start: int, stop: int) -> np.ndarray:
+        # POD coefficients written by pod.py
+        if self.type == CylinderType.POD:
+            return np.array(self.dataset["pod"]["coefficients"][start:stop])
+
+        # Delta encoded states are decoded from their keyframe
+        if is_delta_encoded(self.dataset["state"]):
+            if self.decoder is None:
+                self.decoder = DeltaDecoder(self.dataset["state"])
+            states = self.decoder(start, stop)
+        else:
+            states = np.array(self.dataset["state"][start:stop])
+
+        # Scatter packed states onto the grid
+        if self.packed:
+            mask = self.mask.numpy()
+            grid = np.zeros((*states.shape[:2], *mask.shape), dtype=states.dtype)
+            grid[:, :, mask] = states
+            return grid
+        return states
@@ -6,6 +6,8 @@ import torch
 from torch import Tensor
 from torch.utils.data import Dataset
 
+from cylinderdata.dataset.ring_buffer import RingBuffer
+
 
 class H5SequenceDataset(ABC, Dataset[Tensor]):
     def __init__(self, path: Path, sequence_length: int, include_control: bool = False):
@@ -15,6 +17,11 @@ class H5SequenceDataset(ABC, Dataset[Tensor]):
         self.include_control = include_control
         self.dataset = None
 
+        # Windows of the last item, reused when items are read in order
+        self.last_idx = None
+        self.state_window = None
+        self.control_window = None
+
         # Try to read dataset and its parameters
         try:
             with h5py.File(path, "r") as simulation:
@@ -31,16 +38,31 @@ class H5SequenceDataset(ABC, Dataset[Tensor]):
         if self.dataset is None:
             self.dataset = h5py.File(self.path, "r")
 
-        # Get sequence of states
-        state_seq = torch.stack(
-            [self.get_dataset_state(idx + j) for j in range(0, self.sequence_length)]
-        )
+        # Only read the newest step if the previous item was idx - 1
+        if self.last_idx is not None and idx == self.last_idx + 1:
+            steps = [idx + self.sequence_length - 1]
+        else:
+            steps = range(idx, idx + self.sequence_length)
+        self.last_idx = idx
+
+        # Get sequence of states, the window holds frames before the transform so that
+        # random transforms are drawn for every item
+        for step in steps:
+            state = self.get_dataset_state(step)
+            if self.state_window is None:
+                self.state_window = RingBuffer(self.sequence_length, state.shape)
+            self.state_window.append(state.numpy())
+        state_seq = torch.tensor(self.state_window.view())
+        state_seq = torch.stack([self.transform_state(state) for state in state_seq])
 
         # Get sequence of controls
         if self.include_control:
-            control_seq = torch.stack(
-                [self.get_dataset_control(idx + j) for j in range(0, self.sequence_length)]
-            )
+            for step in steps:
+                control = self.get_dataset_control(step)
+                if self.control_window is None:
+                    self.control_window = RingBuffer(self.sequence_length, control.shape)
+                self.control_window.append(control.numpy())
+            control_seq = torch.tensor(self.control_window.view())
             return state_seq, control_seq
 
         return state_seq
@@ -54,3 +76,6 @@ class H5SequenceDataset(ABC, Dataset[Tensor]):
     @abstractmethod
     def get_dataset_state(self, idx: int) -> Tensor:
         raise NotImplementedError("Subclasses of H5Dataset should implement get_dataset_state().")
+
+    def transform_state(self, state: Tensor) -> Tensor:
+        return state
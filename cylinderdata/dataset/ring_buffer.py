@@ -0,0 +1,42 @@
+from typing import Any, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+
+class RingBuffer:
+    """
+    Fixed-capacity sliding window of equally shaped arrays, oldest first. Every item is
+    written twice so that the ordered window is always a contiguous slice of the storage.
+    The window starts filled with zeros.
+    """
+
+    def __init__(self, capacity: int, shape: Tuple[int, ...], dtype: Any = np.float32) -> None:
+        self.capacity = capacity
+        self.data = np.zeros((2 * capacity, *shape), dtype=dtype)
+        self.start = 0
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.capacity
+
+    def __getitem__(self, idx: Any) -> Any:
+        return self.view()[idx]
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+    def append(self, item: npt.ArrayLike) -> None:
+        # Overwrite the oldest item in both halves
+        self.data[self.start] = item
+        self.data[self.start + self.capacity] = item
+        self.start = (self.start + 1) % self.capacity
+        self.count += 1
+
+    def view(self) -> npt.NDArray:
+        """
+        Ordered window without copying, valid until the next append
+        """
+        start, end = self.start, self.start + self.capacity
+        return self.data[start:end]
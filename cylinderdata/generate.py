@@ -5,6 +5,7 @@ import hydrogym.firedrake as hgym
 from firedrake import Interpolate, assemble, inner, sqrt
 
 rootutils.setup_root(__file__, indicator="pyproject.toml", pythonpath=True)
+from cylinderdata.control import ScheduledController, compile_schedule
 from cylinderdata.utils import H5DatasetCallback, LogControlCallback, LogObservationCallback
 
 
@@ -19,26 +20,49 @@ def compute_fields(flow: hgym.RotaryCylinder):
 
 
 def generate_cylinder(cfg: DictConfig):
-    # Define system
+    # Continue an interrupted run from its last checkpoint
     sim = cfg.sim
-    flow = hgym.RotaryCylinder(
-        Re=sim.re,
-        mesh=sim.mesh,
-        velocity_order=sim.velocity_order,
-    )
+    filename = "../Cylinder-Dataset/cylinder.h5"
+    t_resume = H5DatasetCallback.read_checkpoint(filename) if cfg.resume else None
+
+    # Define system
+    if t_resume is not None:
+        flow = hgym.RotaryCylinder(
+            Re=sim.re,
+            mesh=sim.mesh,
+            velocity_order=sim.velocity_order,
+            restart=H5DatasetCallback.checkpoint_filename(filename),
+        )
+    else:
+        flow = hgym.RotaryCylinder(
+            Re=sim.re,
+            mesh=sim.mesh,
+            velocity_order=sim.velocity_order,
+        )
 
     # Controller
     controller = hydra.utils.instantiate(
-        cfg.control, max_control=flow.MAX_CONTROL, control_duration=cfg.control_duration
+        cfg.controller,
+        max_control=flow.MAX_CONTROL,
+        control_duration=cfg.control_duration,
+        start_time=cfg.control_start,
     )
 
+    # Evaluate open-loop controllers once and replay them by lookup
+    schedule = None
+    if cfg.precompute_control:
+        schedule = compile_schedule(controller, sim.dt, sim.episode_length + sim.cook_length)
+        controller = ScheduledController(
+            flow.MAX_CONTROL, cfg.control_start, cfg.control_duration, schedule, sim.dt
+        )
+
     # Callbacks
     steps = round(sim.episode_length / (cfg.interval * sim.dt))
     callbacks = [
         LogObservationCallback(interval=cfg.interval, tf=sim.episode_length),
         LogControlCallback(interval=cfg.interval),
         H5DatasetCallback(
-            filename="../Cylinder-Dataset/cylinder.h5",
+            filename=filename,
             t_start=sim.cook_length,
             flow=flow,
             fields=compute_fields,
@@ -46,13 +70,22 @@ def generate_cylinder(cfg: DictConfig):
             grid_N=(128, 512),
             grid_domain=((-2, 2), (-2, 14)),
             interval=cfg.interval,
+            control_schedule=schedule,
+            dt=sim.dt,
+            checkpoint_interval=cfg.checkpoint_interval,
+            resume=t_resume is not None,
+            adaptive_threshold=cfg.adaptive_threshold,
+            adaptive_max_gap=cfg.adaptive_max_gap,
+            keyframe_interval=cfg.keyframe_interval,
+            quantization=cfg.quantization,
+            packed=cfg.packed,
         ),
     ]
 
     # Run simulation
     hgym.integrate(
         flow,
-        t_span=(0, sim.episode_length + sim.cook_length),
+        t_span=(t_resume or 0, sim.episode_length + sim.cook_length),
         dt=sim.dt,
         callbacks=callbacks,
         controller=controller,
@@ -62,7 +95,7 @@ def generate_cylinder(cfg: DictConfig):
 
 @hydra.main(version_base=None, config_path="config", config_name="config")
 def main(cfg: DictConfig) -> None:
-    generate_cylinder(cfg.sim)
+    generate_cylinder(cfg)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,3 @@
+from .grid_gather import GridGather
+
+__all__ = ["GridGather"]
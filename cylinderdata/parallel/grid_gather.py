@@ -0,0 +1,68 @@
+from typing import Any, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+
+class GridGather:
+    """
+    Collects field values of grid points distributed over MPI ranks into full grids on
+    the root rank with one Gatherv per snapshot. Grid indices are gathered once.
+    """
+
+    def __init__(
+        self,
+        comm: Any,
+        rows: npt.NDArray[np.int64],
+        cols: npt.NDArray[np.int64],
+        shape: Tuple[int, int],
+        root: int = 0,
+    ) -> None:
+        self.comm = comm
+        self.root = root
+        self.shape = shape
+        self.is_root = comm.rank == root
+
+        # Number of points owned by each rank and their offsets in the gathered buffer
+        self.counts = np.array(comm.allgather(len(rows)))
+        self.displs = np.concatenate(([0], np.cumsum(self.counts)[:-1]))
+        self.size = int(self.counts.sum())
+
+        # Grid index of every gathered point
+        self.rows = self._gather(np.ascontiguousarray(rows, dtype=np.int64))
+        self.cols = self._gather(np.ascontiguousarray(cols, dtype=np.int64))
+
+        # Grid points inside the mesh and the order of gathered points in the packed layout
+        self.mask, self.order = None, None
+        if self.is_root:
+            self.mask = np.zeros(shape, dtype=bool)
+            self.mask[self.rows, self.cols] = True
+            self.order = np.argsort(self.rows * shape[1] + self.cols)
+
+    def _gather(self, local: npt.NDArray) -> Optional[npt.NDArray]:
+        # Gather rank-major along the first axis
+        width = int(np.prod(local.shape[1:]))
+        recvbuf, result = None, None
+        if self.is_root:
+            result = np.empty((self.size, *local.shape[1:]), dtype=local.dtype)
+            recvbuf = [result, self.counts * width, self.displs * width]
+        self.comm.Gatherv(local, recvbuf, root=self.root)
+        return result
+
+    def __call__(
+        self, values: npt.NDArray, packed: bool = False
+    ) -> Optional[npt.NDArray[np.float32]]:
+        """
+        Gather local values of shape (channels, points) into (channels, *shape) on root,
+        or into (channels, valid points) in the row-major order of the mask if packed
+        """
+        gathered = self._gather(np.ascontiguousarray(values.T, dtype=np.float32))
+        if not self.is_root:
+            return None
+        if packed:
+            return np.ascontiguousarray(gathered[self.order].T)
+
+        # Points outside of the mesh remain zero
+        grid = np.zeros((values.shape[0], *self.shape), dtype=np.float32)
+        grid[:, self.rows, self.cols] = gathered.T
+        return grid
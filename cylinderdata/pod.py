@@ -0,0 +1,131 @@
+import argparse
+import pathlib
+from typing import Iterator, Tuple
+
+import h5py
+import numpy as np
+import numpy.typing as npt
+import rootutils
+
+rootutils.setup_root(__file__, indicator="pyproject.toml", pythonpath=True)
+from cylinderdata.codec import DeltaDecoder, is_delta_encoded
+
+
+def valid_mask(simulation: h5py.File) -> npt.NDArray[np.bool_]:
+    """
+    Grid points inside the flow domain, from the stored mask or the first frame
+    """
+    if "mask" in simulation:
+        return np.array(simulation["mask"], dtype=bool)
+    return np.any(np.array(simulation["state"][0]) != 0, axis=0)
+
+
+def read_chunks(
+    simulation: h5py.File, frames: int, chunk_frames: int
+) -> Iterator[Tuple[int, npt.NDArray[np.float32]]]:
+    dataset = simulation["state"]
+    decoder = DeltaDecoder(dataset) if is_delta_encoded(dataset) else None
+    for start in range(0, frames, chunk_frames):
+        stop = min(start + chunk_frames, frames)
+        if decoder is not None:
+            yield start, decoder(start, stop)
+        else:
+            yield start, np.array(dataset[start:stop], dtype=np.float32)
+
+
+def build_pod(
+    path: pathlib.Path,
+    rank: int,
+    oversample: int = 10,
+    power_iterations: int = 1,
+    chunk_frames: int = 100,
+    mask: bool = True,
+) -> None:
+    """
+    Randomized SVD of the mean-subtracted snapshots, streamed chunk by chunk from the
+    state dataset. Writes modes, singular values, mean and per-frame coefficients to
+    the pod group of the file.
+    """
+    with h5py.File(path, "r") as simulation:
+        frames = int(simulation.attrs.get("frames", simulation.attrs["steps"]))
+        channels = simulation["state"].shape[1]
+        packed = bool(simulation["state"].attrs.get("packed", False))
+        points = valid_mask(simulation)
+        if not mask and not packed:
+            points = np.ones_like(points)
+        shape = (channels, *points.shape)
+
+        def snapshots():
+            # Masked snapshots as rows of (frames, features), packed states are masked
+            for start, chunk in read_chunks(simulation, frames, chunk_frames):
+                X = chunk if packed else chunk[:, :, points]
+                yield start, start + len(chunk), X.reshape(len(chunk), -1)
+
+        # Temporal mean
+        mean = 0.0
+        for _, _, X in snapshots():
+            mean = mean + X.sum(axis=0, dtype=np.float64)
+        mean = (mean / frames).astype(np.float32)
+
+        # Range of the snapshot matrix from a random projection of its features
+        rng = np.random.default_rng(0)
+        omega = rng.standard_normal((len(mean), rank + oversample)).astype(np.float32)
+        Y = np.empty((frames, rank + oversample), dtype=np.float32)
+        for start, stop, X in snapshots():
+            Y[start:stop] = (X - mean) @ omega
+        Q = np.linalg.qr(Y)[0]
+
+        # Power iterations sharpen the decay of the spectrum
+        for _ in range(power_iterations):
+            Z = np.zeros((len(mean), Q.shape[1]), dtype=np.float32)
+            for start, stop, X in snapshots():
+                Z += (X - mean).T @ Q[start:stop]
+            for start, stop, X in snapshots():
+                Y[start:stop] = (X - mean) @ Z
+            Q = np.linalg.qr(Y)[0]
+
+        # Project onto the range and decompose the small matrix
+        B = np.zeros((Q.shape[1], len(mean)), dtype=np.float32)
+        for start, stop, X in snapshots():
+            B += Q[start:stop].T @ (X - mean)
+        U, S, Vt = np.linalg.svd(B, full_matrices=False)
+        coefficients = Q @ (U[:, :rank] * S[:rank])
+
+    # Modes and mean on the full grid, zero outside of the mask
+    modes = np.zeros((rank, *shape), dtype=np.float32)
+    modes[:, :, points] = Vt[:rank].reshape(rank, shape[0], -1)
+    full_mean = np.zeros(shape, dtype=np.float32)
+    full_mean[:, points] = mean.reshape(shape[0], -1)
+
+    with h5py.File(path, "r+") as simulation:
+        if "pod" in simulation:
+            del simulation["pod"]
+        pod = simulation.create_group("pod")
+        pod.create_dataset("modes", data=modes, compression="gzip")
+        pod.create_dataset("mean", data=full_mean, compression="gzip")
+        pod.create_dataset("singular_values", data=S[:rank])
+        pod.create_dataset("coefficients", data=coefficients.astype(np.float32))
+        pod.create_dataset("mask", data=points)
+        pod.attrs["rank"] = rank
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename", help="Path to the dataset")
+    parser.add_argument("--rank", type=int, default=64, help="Number of POD modes")
+    parser.add_argument("--oversample", type=int, default=10)
+    parser.add_argument("--power-iterations", type=int, default=1)
+    parser.add_argument("--chunk-frames", type=int, default=100)
+    parser.add_argument(
+        "--no-mask", action="store_true", help="Use all grid points of unpacked states"
+    )
+    args = parser.parse_args()
+
+    build_pod(
+        pathlib.Path(args.filename),
+        args.rank,
+        args.oversample,
+        args.power_iterations,
+        args.chunk_frames,
+        mask=not args.no_mask,
+    )
@@ -1,3 +1,6 @@
+from typing import Optional
+
+import h5py
 import hydra
 import rootutils
 from omegaconf import DictConfig
@@ -5,6 +8,7 @@ import hydrogym.firedrake as hgym
 from hydrogym.firedrake.utils.io import CheckpointCallback
 
 rootutils.setup_root(__file__, indicator="pyproject.toml", pythonpath=True)
+from cylinderdata.control import ScheduledController, compile_schedule, save_schedule
 from cylinderdata.utils.callbacks import (
     CylinderVisCallback,
     LogControlCallback,
@@ -12,7 +16,7 @@ from cylinderdata.utils.callbacks import (
 )
 
 
-def run_cylinder(cfg: DictConfig):
+def run_cylinder(cfg: DictConfig, observer: Optional[LogObservationCallback] = None):
 
     # Define system
     sim = cfg.sim
@@ -32,7 +36,7 @@ def run_cylinder(cfg: DictConfig):
 
     # Callbacks
     callbacks = [
-        LogObservationCallback(interval=cfg.interval, tf=sim.episode_length),
+        observer or LogObservationCallback(interval=cfg.interval, tf=sim.episode_length),
         LogControlCallback(interval=1),
         CheckpointCallback(interval=100, filename="checkpoint.h5"),
     ]
@@ -47,6 +51,15 @@ def run_cylinder(cfg: DictConfig):
         start_time=cfg.control_start,
     )
 
+    # Evaluate open-loop controllers once and replay them by lookup
+    if cfg.precompute_control:
+        schedule = compile_schedule(controller, sim.dt, sim.episode_length)
+        with h5py.File("control_schedule.h5", "w") as file:
+            save_schedule(file, schedule, sim.dt)
+        controller = ScheduledController(
+            flow.MAX_CONTROL, cfg.control_start, cfg.control_duration, schedule, sim.dt
+        )
+
     # Run simulation
     hgym.integrate(
         flow,
@@ -0,0 +1,3 @@
+from .surrogate_cylinder import SurrogateCylinder, integrate
+
+__all__ = ["SurrogateCylinder", "integrate"]
@@ -0,0 +1,167 @@
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Optional, Sequence
+
+import h5py
+import numpy as np
+import numpy.typing as npt
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _regressors(
+    observation: npt.NDArray[np.float32], control: npt.NDArray[np.float32], delays: int
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    # Delay windows of shape (samples, delays, features). control[j] is recorded with the
+    # observation it produced, so the control windows end with the control of the target
+    obs_windows = sliding_window_view(observation, delays, axis=0).transpose(0, 2, 1)
+    ctrl_windows = sliding_window_view(control[1:], delays, axis=0).transpose(0, 2, 1)
+
+    # Each window predicts the observation following it
+    n = len(obs_windows) - 1
+    features = np.concatenate(
+        [
+            obs_windows[:n].reshape(n, -1),
+            ctrl_windows[:n].reshape(n, -1),
+            np.ones((n, 1)),
+        ],
+        axis=1,
+    )
+    return features, observation[delays:]
+
+
+class SurrogateCylinder:
+    """
+    Linear delay-embedded model of the lift and drag response to cylinder rotation.
+    Exposes the get_observations()/control_state surface of hgym.RotaryCylinder for
+    n_envs independent copies that are stepped together.
+    """
+
+    MAX_CONTROL = 0.5 * np.pi
+
+    def __init__(
+        self,
+        weights: npt.NDArray[np.float64],
+        initial_observation: npt.NDArray[np.float64],
+        initial_control: npt.NDArray[np.float64],
+        dt: float,
+        n_envs: int = 1,
+    ) -> None:
+        self.weights = weights
+        self.initial_observation = initial_observation
+        self.initial_control = initial_control
+        self.delays = initial_observation.shape[0]
+        self.dt = dt
+        self.n_envs = n_envs
+        self.reset()
+
+    @classmethod
+    def fit(
+        cls, paths: Iterable[Path], delays: int = 8, ridge: float = 1e-6, n_envs: int = 1
+    ) -> "SurrogateCylinder":
+        """
+        Fit by ridge regression on the observation and control series of datasets.
+        Only stored frames are used and they must be uniformly spaced in time.
+        """
+        features, targets = [], []
+        for path in paths:
+            with h5py.File(path, "r") as file:
+                frames = int(file.attrs.get("frames", file.attrs["steps"]))
+                observation = np.array(file["observation"][:frames], dtype=np.float64)
+                control = np.array(file["control"][:frames], dtype=np.float64)
+                dt = float(file.attrs["dt"])
+                if "time" in file and not np.allclose(np.diff(file["time"][:frames]), dt):
+                    raise ValueError(f"Frames of {path} are not uniformly sampled with dt {dt}")
+            x, y = _regressors(observation, control, delays)
+            features.append(x)
+            targets.append(y)
+
+        X = np.concatenate(features)
+        Y = np.concatenate(targets)
+        gram = X.T @ X + ridge * np.eye(X.shape[1])
+        weights = np.linalg.solve(gram, X.T @ Y)
+
+        # Start from the last window of the training data, where shedding is developed.
+        # step() shifts in the next control, so the windows end at the same sample
+        return cls(weights, observation[-delays:], control[-delays:], dt, n_envs)
+
+    @classmethod
+    def load(cls, path: Path, n_envs: int = 1) -> "SurrogateCylinder":
+        with h5py.File(path, "r") as file:
+            return cls(
+                np.array(file["weights"]),
+                np.array(file["initial_observation"]),
+                np.array(file["initial_control"]),
+                float(file.attrs["dt"]),
+                n_envs,
+            )
+
+    def save(self, path: Path) -> None:
+        with h5py.File(path, "w") as file:
+            file["weights"] = self.weights
+            file["initial_observation"] = self.initial_observation
+            file["initial_control"] = self.initial_control
+            file.attrs["dt"] = self.dt
+
+    def reset(self) -> None:
+        self.t = 0.0
+        self.observation = np.tile(self.initial_observation, (self.n_envs, 1, 1))
+        self.control = np.tile(self.initial_control, (self.n_envs, 1, 1))
+
+    def get_observations(self) -> tuple[Any, Any]:
+        CL, CD = self.observation[:, -1].T
+        if self.n_envs == 1:
+            return float(CL[0]), float(CD[0])
+        return CL, CD
+
+    @property
+    def control_state(self) -> Any:
+        if self.n_envs == 1:
+            return self.control[0, -1].tolist()
+        return self.control[:, -1]
+
+    def step(self, action: Any) -> None:
+        action = np.asarray(action, dtype=np.float64)
+        action = np.clip(action, -self.MAX_CONTROL, self.MAX_CONTROL)
+        if action.ndim == 1 and self.n_envs > 1:
+            action = action[:, None]
+        action = np.broadcast_to(action, (self.n_envs, self.control.shape[2]))
+
+        # Shift delay windows and predict next observation
+        self.control = np.concatenate([self.control[:, 1:], action[:, None]], axis=1)
+        features = np.concatenate(
+            [
+                self.observation.reshape(self.n_envs, -1),
+                self.control.reshape(self.n_envs, -1),
+                np.ones((self.n_envs, 1)),
+            ],
+            axis=1,
+        )
+        prediction = features @ self.weights
+        self.observation = np.concatenate([self.observation[:, 1:], prediction[:, None]], axis=1)
+        self.t += self.dt
+
+
+def integrate(
+    flow: SurrogateCylinder,
+    t_span: tuple[float, float],
+    controller: Callable | Sequence[Callable],
+    callbacks: Optional[List[Callable]] = None,
+) -> None:
+    """
+    Counterpart of hgym.integrate for the surrogate. Takes a single controller or one
+    controller per environment.
+    """
+    callbacks = callbacks or []
+    n_steps = int(round((t_span[1] - t_span[0]) / flow.dt))
+    for iter in range(n_steps):
+        t = t_span[0] + iter * flow.dt
+        if callable(controller):
+            action = controller(t, flow.get_observations())
+        else:
+            CL, CD = flow.observation[:, -1].T
+            action = [[c(t, (cl, cd))] for c, cl, cd in zip(controller, CL, CD)]
+        flow.step(action)
+        for callback in callbacks:
+            callback(iter, t, flow)
+
+    for callback in callbacks:
+        callback.close()
@@ -0,0 +1,91 @@
+import csv
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List
+
+import hydra
+import rootutils
+from omegaconf import DictConfig, OmegaConf
+
+rootutils.setup_root(__file__, indicator="pyproject.toml", pythonpath=True)
+from cylinderdata.run import run_cylinder
+from cylinderdata.utils import EarlyStoppingCallback, TrialPruned
+
+
+def grid(params: DictConfig) -> List[Dict[str, Any]]:
+    names = list(params.keys())
+    values = [list(params[name]) for name in names]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def run_trial(
+    cfg: DictConfig, root: str, trial: int, params: Dict[str, Any], best: Any, lock: Any
+) -> Dict:
+    # Each trial writes its plots and checkpoints to its own directory under the sweep
+    # root, workers are reused and keep the working directory of their last trial
+    trial_dir = os.path.join(root, f"trial_{trial:03d}")
+    os.makedirs(trial_dir, exist_ok=True)
+    os.chdir(trial_dir)
+
+    # Override controller parameters
+    cfg = cfg.copy()
+    for name, value in params.items():
+        OmegaConf.update(cfg, f"controller.{name}", value)
+
+    observer = EarlyStoppingCallback(
+        tf=cfg.sim.episode_length,
+        best=best,
+        warmup=cfg.sweep.warmup,
+        margin=cfg.sweep.margin,
+        interval=cfg.interval,
+    )
+    try:
+        run_cylinder(cfg, observer=observer)
+        status, t_end, drag = "complete", cfg.sim.episode_length, observer.mean_drag()
+    except TrialPruned as pruned:
+        status, t_end, drag = "pruned", pruned.t, pruned.drag
+
+    # Only finished episodes set the bar for pruning
+    if status == "complete":
+        with lock:
+            best.value = min(best.value, drag)
+
+    return {"trial": trial, **params, "drag": drag, "status": status, "t_end": t_end}
+
+
+def run_sweep(cfg: DictConfig) -> None:
+    trials = grid(cfg.sweep.params)
+    root = os.getcwd()
+    results = []
+
+    # Spawn workers so that each one initialises its own MPI/PETSc state
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager:
+        best = manager.Value("d", float("inf"))
+        lock = manager.Lock()
+        with ProcessPoolExecutor(max_workers=cfg.sweep.workers, mp_context=context) as pool:
+            futures = [
+                pool.submit(run_trial, cfg, root, trial, params, best, lock)
+                for trial, params in enumerate(trials)
+            ]
+            for future in as_completed(futures):
+                results.append(future.result())
+
+    # Write ranked results, finished episodes first
+    results.sort(key=lambda r: (r["status"] != "complete", r["drag"]))
+    with open("sweep_results.csv", "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=["rank", *results[0].keys()])
+        writer.writeheader()
+        for rank, result in enumerate(results):
+            writer.writerow({"rank": rank, **result})
+
+
+@hydra.main(version_base=None, config_path="config", config_name="sweep")
+def main(cfg: DictConfig) -> None:
+    run_sweep(cfg)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 from .callbacks import (
     CylinderVisCallback,
+    EarlyStoppingCallback,
     H5DatasetCallback,
     LogControlCallback,
     LogObservationCallback,
+    TrialPruned,
 )
 from .image_visualizer import CylinderVisualizer, ImageVisualizer
 
@@ -10,7 +12,9 @@ __all__ = [
     "CylinderVisualizer",
     "ImageVisualizer",
     "CylinderVisCallback",
+    "EarlyStoppingCallback",
     "H5DatasetCallback",
     "LogControlCallback",
     "LogObservationCallback",
+    "TrialPruned",
 ]
@@ -1,5 +1,6 @@
 import os
-from typing import Callable, Optional, Tuple
+import warnings
+from typing import Any, Callable, Optional, Tuple
 import h5py
 from tqdm import tqdm
 import matplotlib
@@ -10,6 +11,11 @@ from matplotlib import pyplot as plt
 from firedrake import FunctionSpace, VertexOnlyMesh, assemble
 from firedrake.__future__ import interpolate
 from hydrogym.core import CallbackBase, PDEBase
+from hydrogym.firedrake.utils.io import CheckpointCallback
+
+from cylinderdata.codec import ChunkIndex, DeltaDecoder, DeltaEncoder
+from cylinderdata.control.scheduled import save_schedule
+from cylinderdata.parallel import GridGather
 
 
 class LogObservationCallback(CallbackBase):
@@ -53,6 +59,46 @@ class LogObservationCallback(CallbackBase):
         fig.savefig("observation.png")
 
 
+class TrialPruned(Exception):
+    def __init__(self, t: float, drag: float):
+        super().__init__(f"Trial pruned at t={t} with mean drag {drag}")
+        self.t = t
+        self.drag = drag
+
+
+class EarlyStoppingCallback(LogObservationCallback):
+    """
+    Logs observations and aborts the episode once its mean drag after the warmup
+    is clearly worse than the best finished episode.
+    """
+
+    def __init__(
+        self,
+        tf: float,
+        best: Any,
+        warmup: float,
+        margin: float,
+        interval: Optional[int] = 1,
+    ):
+        super().__init__(tf=tf, interval=interval)
+        self.best = best
+        self.warmup = warmup
+        self.margin = margin
+
+    def __call__(self, iter: int, t: float, flow: PDEBase):
+        # Only check when a new observation was logged
+        logged = len(self.time)
+        super().__call__(iter, t, flow)
+        if len(self.time) > logged and t >= self.warmup:
+            drag = self.mean_drag()
+            if drag > self.best.value * (1 + self.margin):
+                raise TrialPruned(t, drag)
+
+    def mean_drag(self) -> float:
+        drag = [obs[1] for t, obs in zip(self.time, self.observations) if t >= self.warmup]
+        return float(np.mean(drag)) if len(drag) > 0 else float("inf")
+
+
 class LogControlCallback(CallbackBase):
     def __init__(
         self,
@@ -112,7 +158,16 @@ class H5DatasetCallback(CallbackBase):
         steps: int,
         grid_N: Tuple[int, int],
         grid_domain: Tuple[Tuple[float, float], Tuple[float, float]],
+        dt: float,
         interval: Optional[int] = 1,
+        control_schedule: Optional[np.ndarray] = None,
+        checkpoint_interval: Optional[int] = None,
+        resume: bool = False,
+        adaptive_threshold: Optional[float] = None,
+        adaptive_max_gap: int = 10,
+        keyframe_interval: Optional[int] = None,
+        quantization: float = 1e-4,
+        packed: bool = False,
     ):
         super().__init__(interval=interval)
 
@@ -130,21 +185,100 @@ class H5DatasetCallback(CallbackBase):
         self.grid_mesh = VertexOnlyMesh(flow.mesh, self.points, missing_points_behaviour="warn")
         self.grid = FunctionSpace(self.grid_mesh, "DG", 0)
 
-        # Create file
+        # Save simulation parameters
+        self.t_start = t_start
+        self.steps = steps
+        self.N = grid_N
+        self.domain = grid_domain
+
+        # Adaptive sampling stores a candidate frame only if CL, CD or the control changed
+        self.adaptive_threshold = adaptive_threshold
+        self.adaptive_max_gap = adaptive_max_gap
+        self.last_signal = None
+        self.skipped = 0
+        self.truncated = False
+
+        # Only store grid points inside the mesh
+        self.packed = packed
+
+        # Keyframes and quantized deltas instead of full frames
+        self.encoder = None
+        if keyframe_interval is not None:
+            self.encoder = DeltaEncoder(keyframe_interval, quantization)
+
+        # Each rank owns part of the grid points, rank 0 gathers and writes them
+        coordinates = self.grid_mesh.coordinates.dat.data
+        self.comm = self.grid_mesh.comm
+        self.gather = GridGather(
+            self.comm,
+            rows=self.domain2index(coordinates[:, 1], self.domain[0], self.N[0]),
+            cols=self.domain2index(coordinates[:, 0], self.domain[1], self.N[1]),
+            shape=self.N,
+        )
+
+        # Checkpoint the flow together with the dataset position. The flow is written to a
+        # temporary file that replaces the checkpoint once the position is stored in it
+        self.dt = dt
+        self.checkpoint = None
+        self.checkpoint_path = self.checkpoint_filename(filename)
+        if checkpoint_interval is not None:
+            self.checkpoint = CheckpointCallback(
+                interval=checkpoint_interval,
+                filename=os.path.splitext(self.checkpoint_path)[0] + ".tmp.h5",
+            )
+
+        # Continue the file of an interrupted run, or create a new one
+        self.file = None
+        self.state_idx = 0
+        self.iter_offset = 0
+        if resume:
+            self.open_file(filename)
+        elif self.gather.is_root:
+            self.create_file(filename, steps, len(flow.control_state), interval)
+
+            # Save the precomputed control that is applied at every solver step
+            if control_schedule is not None:
+                save_schedule(self.file, control_schedule, dt)
+
+    def create_file(self, filename: str, steps: int, control_len: int, interval: int):
         os.makedirs(os.path.dirname(filename), exist_ok=True)
         self.file = h5py.File(filename, "w")
 
+        # Grid points inside the mesh, computed once
+        self.file.create_dataset("mask", data=self.gather.mask)
+        if self.packed:
+            frame = (self.channels, int(self.gather.mask.sum()))
+        else:
+            frame = (self.channels, self.N[0], self.N[1])
+
         # Create datasets for state and control
-        self.state_idx = 0
-        self.dataset_state = self.file.create_dataset(
-            "state",
-            (steps, self.channels, grid_N[0], grid_N[1]),
-            chunks=(10, self.channels, grid_N[0], grid_N[1]),
-            compression="gzip",
-            dtype=np.float32,
+        if self.encoder is None:
+            self.dataset_state = self.file.create_dataset(
+                "state",
+                (steps, *frame),
+                chunks=(10, *frame),
+                compression="gzip",
+                dtype=np.float32,
+            )
+        else:
+            # One chunk per keyframe segment
+            self.dataset_state = self.file.create_dataset(
+                "state",
+                (steps, *frame),
+                chunks=(self.encoder.keyframe_interval, *frame),
+                compression="gzip",
+                shuffle=True,
+                dtype=np.int32,
+            )
+            self.dataset_state.attrs["keyframe_interval"] = self.encoder.keyframe_interval
+            self.dataset_state.attrs["quantization"] = self.encoder.quantization
+        self.dataset_state.attrs["packed"] = self.packed
+
+        # Checksums and ranges of every state chunk for fast validation
+        self.index = ChunkIndex.create(
+            self.file, steps, self.dataset_state.chunks[0], self.channels
         )
 
-        control_len = len(flow.control_state)
         self.dataset_control = self.file.create_dataset(
             "control",
             (steps, control_len),
@@ -153,47 +287,183 @@ class H5DatasetCallback(CallbackBase):
             dtype=np.float32,
         )
 
-        # Save simulation parameters
-        self.t_start = t_start
-        self.N = grid_N
-        self.domain = grid_domain
+        # Lift and drag coefficients, used to fit surrogate models
+        self.dataset_observation = self.file.create_dataset(
+            "observation",
+            (steps, 2),
+            chunks=(steps, 2),
+            compression="gzip",
+            dtype=np.float32,
+        )
+
+        # Simulation time of every stored frame
+        self.dataset_time = self.file.create_dataset(
+            "time",
+            (steps,),
+            chunks=(steps,),
+            dtype=np.float64,
+        )
 
         self.file.attrs["steps"] = steps
-        self.file.attrs["N"] = grid_N
-        self.file.attrs["domain"] = grid_domain
+        self.file.attrs["frames"] = 0
+        self.file.attrs["complete"] = False
+        self.file.attrs["adaptive"] = self.adaptive_threshold is not None
+        self.file.attrs["N"] = self.N
+        self.file.attrs["domain"] = self.domain
+        self.file.attrs["dt"] = interval * self.dt
+
+    def open_file(self, filename: str):
+        position, consistent = None, None
+        if self.gather.is_root:
+            self.file = h5py.File(filename, "a")
+            self.dataset_state = self.file["state"]
+            self.dataset_control = self.file["control"]
+            self.dataset_observation = self.file["observation"]
+            self.dataset_time = self.file["time"]
+            with h5py.File(self.checkpoint_path, "r") as checkpoint:
+                self.state_idx = int(checkpoint.attrs["state_idx"])
+                position = (self.state_idx, int(checkpoint.attrs["iter"]))
+            consistent = self.check_tail()
+            if self.encoder is not None:
+                self.encoder.resume(self.dataset_state, self.state_idx)
+
+            # Continue the index of the chunk that was being written, files written
+            # without an index are validated in full
+            self.index = None
+            if "index" in self.file:
+                self.index = ChunkIndex(self.file["index"])
+                stop = self.state_idx
+                start = stop // self.index.chunk_frames * self.index.chunk_frames
+                stored = self.dataset_state[start:stop]
+                values = stored
+                if self.encoder is not None:
+                    values = DeltaDecoder(self.dataset_state)(start, stop)
+                self.index.resume(stop, stored, values)
+
+        # All ranks continue from the same position
+        self.state_idx, self.iter_offset = self.comm.bcast(position, root=0)
+        if not self.comm.bcast(consistent, root=0):
+            raise ValueError(f"Dataset {filename} is inconsistent before frame {self.state_idx}")
+
+    @staticmethod
+    def checkpoint_filename(filename: str) -> str:
+        return os.path.splitext(filename)[0] + "_checkpoint.h5"
+
+    @staticmethod
+    def read_checkpoint(filename: str) -> Optional[float]:
+        """
+        Time to restart an interrupted run from, or None if it has no checkpoint
+        """
+        checkpoint = H5DatasetCallback.checkpoint_filename(filename)
+        if not os.path.exists(checkpoint):
+            return None
+        with h5py.File(checkpoint, "r") as file:
+            if "t" not in file.attrs:
+                return None
+            return float(file.attrs["t"])
+
+    def check_tail(self) -> bool:
+        # Frames of the last chunk before the checkpoint must be completely written
+        if self.state_idx == 0:
+            return True
+        chunk = self.dataset_state.chunks[0]
+        start = (self.state_idx - 1) // chunk * chunk
+        stop = self.state_idx
+        tail = self.dataset_state[start:stop].reshape(stop - start, -1)
+
+        # Unchanged delta frames are zero, only the keyframe must be non-zero
+        if self.encoder is not None:
+            tail = tail[:1]
+        return bool(np.all(np.any(tail != 0, axis=1)) and np.all(np.isfinite(tail)))
 
     def __call__(self, iter: int, t: float, flow: PDEBase):
-        if super().__call__(iter, t, flow):
-            # Save after start time
-            if t < self.t_start:
-                return
-            # Get functions and coordinates
-            functions = []
-            coordinates = self.grid_mesh.coordinates.dat.data
-            f = self.get_fields(flow)
-
-            # Evaluate fields at coordinates and save to dataset
-            for i, field in enumerate(f):
-                # Interpolate field to grid
-                functions.append(assemble(interpolate(field, self.grid)).dat.data)
-
-            # Build state
-            state = np.zeros((self.channels, self.N[0], self.N[1]))
-            for idx, (x, y) in enumerate(coordinates):
-                # domain to index
-                i = self.domain2index(y, self.domain[0], self.N[0])
-                j = self.domain2index(x, self.domain[1], self.N[1])
-                for c, f in enumerate(functions):
-                    state[c, i, j] = f[idx]
-            # Get control
-            control = np.array(flow.control_state)
-            # save to datset
-            self.dataset_state[self.state_idx] = state
+        # Iterations continue from the checkpoint when resuming
+        iter += self.iter_offset
+
+        # Save after start time
+        if super().__call__(iter, t, flow) and t >= self.t_start and self.keep(t, flow):
+            self.save(t, flow)
+
+        # Record where to continue from, flow is already advanced to t + dt. Frames are
+        # flushed before the new checkpoint replaces the previous one, so an interrupted
+        # write leaves the previous checkpoint and its position valid
+        if self.checkpoint is not None and iter % self.checkpoint.interval == 0:
+            self.checkpoint(iter, t, flow)
+            self.comm.barrier()
+            if self.file is not None:
+                self.file.flush()
+                with h5py.File(self.checkpoint.filename, "a") as checkpoint:
+                    checkpoint.attrs["state_idx"] = self.state_idx
+                    checkpoint.attrs["iter"] = iter + 1
+                    checkpoint.attrs["t"] = t + self.dt
+                os.replace(self.checkpoint.filename, self.checkpoint_path)
+
+    def keep(self, t: float, flow: PDEBase) -> bool:
+        # Frame budget is used up. Fixed-rate budgets cover the episode, adaptive ones may
+        # run out early and record where the stored frames end
+        if self.state_idx >= self.steps:
+            if self.adaptive_threshold is not None and not self.truncated:
+                self.truncated = True
+                warnings.warn(f"Frame budget of {self.steps} used up, dropping frames from t={t}")
+                if self.file is not None:
+                    self.file.attrs["truncated_t"] = t + self.dt
+            return False
+        if self.adaptive_threshold is None:
+            return True
+
+        # Relative change of CL, CD and control since the last stored frame
+        signal = np.array([*flow.get_observations(), *flow.control_state])
+        self.skipped += 1
+        if self.last_signal is not None and self.skipped < self.adaptive_max_gap:
+            change = np.linalg.norm(signal - self.last_signal)
+            if change <= self.adaptive_threshold * np.linalg.norm(self.last_signal):
+                return False
+
+        self.last_signal = signal
+        self.skipped = 0
+        return True
+
+    def save(self, t: float, flow: PDEBase):
+        # Interpolate fields to the grid points owned by this rank
+        values = np.stack(
+            [assemble(interpolate(field, self.grid)).dat.data for field in self.get_fields(flow)]
+        )
+
+        # Build state on the writing rank
+        state = self.gather(values, packed=self.packed)
+
+        # Get control and observations, collective over all ranks
+        control = np.array(flow.control_state)
+        observation = flow.get_observations()
+
+        # save to datset
+        if self.file is not None:
+            stored, values = state, state
+            if self.encoder is not None:
+                # Index the values as they decode
+                stored = self.encoder(self.state_idx, state)
+                values = self.encoder.previous * self.encoder.quantization
+            stored = np.asarray(stored, dtype=self.dataset_state.dtype)
+            self.dataset_state[self.state_idx] = stored
+            if self.index is not None:
+                self.index.update(self.state_idx, stored, values.astype(np.float32))
             self.dataset_control[self.state_idx] = control
-            self.state_idx += 1
+            self.dataset_observation[self.state_idx] = observation
+            # Flow is already advanced to t + dt
+            self.dataset_time[self.state_idx] = t + self.dt
+            self.file.attrs["frames"] = self.state_idx + 1
+        self.state_idx += 1
 
-    def domain2index(self, value: float, domain: Tuple[float, float], N) -> int:
-        return round((value - domain[0]) * (N - 1) / (domain[1] - domain[0]))
+    def domain2index(self, value: np.ndarray, domain: Tuple[float, float], N) -> np.ndarray:
+        return np.rint((value - domain[0]) * (N - 1) / (domain[1] - domain[0])).astype(np.int64)
+
+    def close(self):
+        # Integration reached the end of the episode
+        if self.file is not None:
+            self.file.attrs["complete"] = True
+            self.file.close()
+            self.file = None
 
     def __del__(self):
-        self.file.close()
+        if self.file is not None:
+            self.file.close()
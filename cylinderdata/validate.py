@@ -0,0 +1,136 @@
+import argparse
+import pathlib
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import h5py
+import numpy as np
+import rootutils
+
+rootutils.setup_root(__file__, indicator="pyproject.toml", pythonpath=True)
+from cylinderdata.codec import DeltaDecoder, channel_range, checksum, is_delta_encoded
+
+
+def verify_chunk(path: pathlib.Path, chunk: int, chunk_frames: int, frames: int) -> Dict:
+    """
+    Decompress one chunk and recompute what the index records about it
+    """
+    with h5py.File(path, "r") as simulation:
+        dataset = simulation["state"]
+        start = chunk * chunk_frames
+        stop = min(start + chunk_frames, frames)
+        stored = dataset[start:stop]
+        values = DeltaDecoder(dataset)(start, stop) if is_delta_encoded(dataset) else stored
+
+    flat = values.reshape(len(values), -1)
+    low, high = channel_range(values)
+    return {
+        "chunk": chunk,
+        "checksum": checksum(stored),
+        "min": low,
+        "max": high,
+        "zero_frames": int(np.sum(np.all(flat == 0, axis=1))),
+        "finite": bool(np.all(np.isfinite(flat))),
+    }
+
+
+def validate_dataset(path: pathlib.Path, workers: int, full: bool) -> List[str]:
+    problems = []
+
+    with h5py.File(path, "r") as simulation:
+        if "state" not in simulation:
+            return ["missing dataset state"]
+
+        # Parameters, steps falls back to the length of the state dataset
+        for key in ["steps", "N", "domain"]:
+            if key not in simulation.attrs:
+                problems.append(f"missing attr {key}")
+        steps = int(simulation.attrs.get("steps", simulation["state"].shape[0]))
+        frames = int(simulation.attrs.get("frames", steps))
+        if frames > steps:
+            problems.append(f"frames attr {frames} exceeds steps {steps}")
+            frames = min(frames, simulation["state"].shape[0])
+
+        # Runs that died leave unwritten steps, adaptive runs may finish with fewer frames
+        if not simulation.attrs.get("complete", False):
+            problems.append(f"generation did not finish, {frames} of {steps} frames written")
+        elif frames < steps and not simulation.attrs.get("adaptive", False):
+            problems.append(f"only {frames} of {steps} frames written")
+        if "truncated_t" in simulation.attrs:
+            t = float(simulation.attrs["truncated_t"])
+            problems.append(f"frame budget ran out, frames from t={t} were dropped")
+
+        # Datasets of every step
+        if simulation["state"].shape[0] != steps:
+            problems.append(f"state has {simulation['state'].shape[0]} steps, expected {steps}")
+        for name in ["control", "observation", "time"]:
+            if name not in simulation:
+                problems.append(f"missing dataset {name}")
+            elif len(simulation[name]) < steps:
+                problems.append(f"{name} has {len(simulation[name])} steps, expected {steps}")
+            elif not np.all(np.isfinite(simulation[name][:frames])):
+                problems.append(f"{name} contains non-finite values")
+
+        # Chunks flagged by the index, or all chunks without one
+        chunk_frames = simulation["state"].chunks[0]
+        chunks = -(-frames // chunk_frames)
+        index = None
+        if "index" not in simulation:
+            problems.append("no chunk index, verifying all chunks")
+            suspicious = set(range(chunks))
+        else:
+            index = {name: np.array(simulation["index"][name]) for name in simulation["index"]}
+            expected = np.clip(frames - np.arange(len(index["written"])) * chunk_frames, 0, None)
+            expected = np.minimum(expected, chunk_frames)
+
+            incomplete = np.flatnonzero(index["written"] != expected)
+            for chunk in incomplete:
+                problems.append(
+                    f"chunk {chunk}: {index['written'][chunk]} of {expected[chunk]} frames written"
+                )
+            finite = np.isfinite(index["min"]).all(axis=1) & np.isfinite(index["max"]).all(axis=1)
+            zero = (index["min"] == 0).all(axis=1) & (index["max"] == 0).all(axis=1)
+            flagged = np.flatnonzero(~finite | zero)
+            suspicious = set(incomplete) | set(flagged)
+            if full:
+                suspicious = set(range(chunks))
+            suspicious = {int(chunk) for chunk in suspicious if chunk < chunks}
+
+    # Decompress only suspicious chunks
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(verify_chunk, path, chunk, chunk_frames, frames)
+            for chunk in sorted(suspicious)
+        ]
+        for future in futures:
+            result = future.result()
+            chunk = result["chunk"]
+            if result["zero_frames"] > 0:
+                problems.append(f"chunk {chunk}: {result['zero_frames']} zero frames")
+            if not result["finite"]:
+                problems.append(f"chunk {chunk}: non-finite values")
+            if index is not None and index["written"][chunk] == expected[chunk]:
+                if result["checksum"] != index["checksum"][chunk]:
+                    problems.append(f"chunk {chunk}: checksum mismatch")
+                elif not np.allclose(result["min"], index["min"][chunk]) or not np.allclose(
+                    result["max"], index["max"][chunk]
+                ):
+                    problems.append(f"chunk {chunk}: range mismatch")
+
+    print(f"{path}: {frames} frames in {chunks} chunks, decompressed {len(suspicious)}")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename", help="Path to the dataset")
+    parser.add_argument("--workers", type=int, default=8, help="Processes verifying chunks")
+    parser.add_argument("--full", action="store_true", help="Decompress and verify all chunks")
+    args = parser.parse_args()
+
+    problems = validate_dataset(pathlib.Path(args.filename), args.workers, args.full)
+    for problem in problems:
+        print(f"  {problem}")
+    print("OK" if len(problems) == 0 else f"{len(problems)} problems")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,103 @@
+import threading
+
+import numpy as np
+import pytest
+
+from cylinderdata.parallel import GridGather
+
+SHAPE = (4, 5)
+CHANNELS = 2
+
+
+class FakeWorld:
+    """
+    Ranks of a communicator run as threads that meet at every collective
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.barrier = threading.Barrier(size)
+        self.slots = [None] * size
+
+    def exchange(self, rank, value):
+        self.slots[rank] = value
+        self.barrier.wait()
+        values = list(self.slots)
+        self.barrier.wait()
+        return values
+
+
+class FakeComm:
+    def __init__(self, world: FakeWorld, rank: int) -> None:
+        self.world = world
+        self.rank = rank
+        self.size = world.size
+
+    def allgather(self, value):
+        return self.world.exchange(self.rank, value)
+
+    def Gatherv(self, sendbuf, recvbuf, root=0):
+        sent = self.world.exchange(self.rank, np.array(sendbuf).ravel())
+        if self.rank == root:
+            result, counts, displs = recvbuf
+            flat = result.reshape(-1)
+            for values, count, displ in zip(sent, counts, displs):
+                assert len(values) == count
+                stop = displ + count
+                flat[displ:stop] = values
+
+
+def field(rows, cols):
+    # Nonzero values that identify channel and grid point
+    return np.stack([100 * c + 10 * rows + cols + 1 for c in range(CHANNELS)]).astype(np.float32)
+
+
+def run_ranks(points_per_rank, packed):
+    # Distinct grid points split unevenly over the ranks
+    rng = np.random.default_rng(0)
+    cells = rng.permutation(SHAPE[0] * SHAPE[1])[: sum(points_per_rank)]
+    splits = np.split(cells, np.cumsum(points_per_rank)[:-1])
+
+    world = FakeWorld(len(points_per_rank))
+    results, masks = [None] * world.size, [None] * world.size
+
+    def rank_main(rank):
+        rows, cols = np.divmod(splits[rank], SHAPE[1])
+        gather = GridGather(FakeComm(world, rank), rows, cols, SHAPE)
+        results[rank] = gather(field(rows, cols), packed=packed)
+        masks[rank] = gather.mask
+
+    threads = [threading.Thread(target=rank_main, args=(rank,)) for rank in range(world.size)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    mask = np.zeros(SHAPE, dtype=bool)
+    mask.flat[cells] = True
+    rows, cols = np.indices(SHAPE)
+    expected = np.where(mask, field(rows, cols), 0)
+    return results, masks, mask, expected
+
+
+@pytest.mark.parametrize("points_per_rank", [[3, 0, 5], [0, 7], [1]])
+def test_full_grid(points_per_rank):
+    results, masks, mask, expected = run_ranks(points_per_rank, packed=False)
+
+    np.testing.assert_array_equal(results[0], expected)
+    np.testing.assert_array_equal(masks[0], mask)
+    assert all(result is None for result in results[1:])
+    assert all(other is None for other in masks[1:])
+
+
+@pytest.mark.parametrize("points_per_rank", [[3, 0, 5], [0, 7], [1]])
+def test_packed_follows_mask_order(points_per_rank):
+    results, _, mask, expected = run_ranks(points_per_rank, packed=True)
+
+    assert results[0].shape == (CHANNELS, mask.sum())
+    np.testing.assert_array_equal(results[0], expected[:, mask])
+
+    # Packed states scatter back onto the full grid
+    grid = np.zeros_like(expected)
+    grid[:, mask] = results[0]
+    np.testing.assert_array_equal(grid, expected)
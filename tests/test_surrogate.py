@@ -0,0 +1,72 @@
+import h5py
+import numpy as np
+import pytest
+
+from cylinderdata.surrogate import SurrogateCylinder
+
+B = np.array([0.6, 0.3])
+
+
+def linear_system(steps: int, seed: int = 0):
+    # obs[j] = 0.9 * obs[j - 1] + B * control[j], control[j] stored with obs[j]
+    rng = np.random.default_rng(seed)
+    control = rng.uniform(-1, 1, (steps, 1))
+    observation = np.zeros((steps, 2))
+    for j in range(1, steps):
+        observation[j] = 0.9 * observation[j - 1] + B * control[j]
+    return observation, control
+
+
+def write_dataset(path, observation, control, steps, time=None):
+    # Datasets are preallocated to steps and filled up to frames
+    frames = len(observation)
+    with h5py.File(path, "w") as file:
+        file.create_dataset("observation", (steps, 2), dtype=np.float64)[:frames] = observation
+        file.create_dataset("control", (steps, 1), dtype=np.float64)[:frames] = control
+        file.create_dataset("time", (steps,), dtype=np.float64)[:frames] = (
+            0.1 * np.arange(1, frames + 1) if time is None else time
+        )
+        file.attrs["steps"] = steps
+        file.attrs["frames"] = frames
+        file.attrs["dt"] = 0.1
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    # Generation stopped before all steps were written
+    observation, control = linear_system(200)
+    path = tmp_path / "sim.h5"
+    write_dataset(path, observation, control, steps=300)
+    return path, observation
+
+
+def test_fit_recovers_linear_system(dataset):
+    path, observation = dataset
+    surrogate = SurrogateCylinder.fit([path], delays=2)
+
+    surrogate.step(1.0)
+    CL, CD = surrogate.get_observations()
+    expected = 0.9 * observation[-1] + B
+    np.testing.assert_allclose([CL, CD], expected, atol=1e-4)
+    assert surrogate.control_state == [1.0]
+
+
+def test_step_follows_linear_system(dataset):
+    path, observation = dataset
+    surrogate = SurrogateCylinder.fit([path], delays=3, n_envs=2)
+
+    expected = np.tile(observation[-1], (2, 1))
+    for action in [0.5, -0.2, 0.0, 1.0]:
+        surrogate.step([[action], [-action]])
+        expected = 0.9 * expected + np.outer([action, -action], B)
+    np.testing.assert_allclose(np.stack(surrogate.get_observations(), axis=1), expected, atol=1e-4)
+
+
+def test_fit_rejects_nonuniform_frames(tmp_path):
+    observation, control = linear_system(50)
+    time = np.cumsum(np.where(np.arange(50) % 2, 0.1, 0.3))
+    path = tmp_path / "adaptive.h5"
+    write_dataset(path, observation, control, steps=50, time=time)
+
+    with pytest.raises(ValueError, match="not uniformly sampled"):
+        SurrogateCylinder.fit([path], delays=2)